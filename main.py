@@ -1,9 +1,20 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from typing import Annotated, List, Optional
-from sqlmodel import Field, Session, SQLModel, create_engine, select, Relationship
+from sqlmodel import Field, SQLModel, select, Relationship
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, func, insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import selectinload
 from contextlib import asynccontextmanager
-import pandas as pd
+import asyncio
+import os
+import time
+import orjson
+import pyarrow as pa
+import pyarrow.csv as pacsv
 
 # Models
 class Announcement(SQLModel, table = True):
@@ -15,7 +26,7 @@ class Announcement(SQLModel, table = True):
 # Association tables for mentors and teammates
 class MentorLink(SQLModel, table=True):
     mentor_id: int = Field(foreign_key="user.id", primary_key=True)
-    mentee_id: int = Field(foreign_key="user.id", primary_key=True)
+    mentee_id: int = Field(foreign_key="user.id", primary_key=True, index=True)
 
 class TeammateLink(SQLModel, table=True):
     user_id: int = Field(foreign_key="user.id", primary_key=True)
@@ -24,7 +35,7 @@ class TeammateLink(SQLModel, table=True):
 # Main User model
 class User(SQLModel, table=True):
     id: int = Field(default=None, primary_key=True)
-    name: str
+    name: str = Field(index=True)
     password: str
     role: str  # Roles: [STUDENT, MENTOR, TEACHER]
     imgURL: str
@@ -39,7 +50,8 @@ class User(SQLModel, table=True):
         link_model=MentorLink,
         sa_relationship_kwargs={
             "primaryjoin": "User.id==MentorLink.mentee_id",
-            "secondaryjoin": "User.id==MentorLink.mentor_id"
+            "secondaryjoin": "User.id==MentorLink.mentor_id",
+            "lazy": "raise"
         }
     )
     mentees: List["User"] = Relationship(
@@ -47,7 +59,8 @@ class User(SQLModel, table=True):
         link_model=MentorLink,
         sa_relationship_kwargs={
             "primaryjoin": "User.id==MentorLink.mentor_id",
-            "secondaryjoin": "User.id==MentorLink.mentee_id"
+            "secondaryjoin": "User.id==MentorLink.mentee_id",
+            "lazy": "raise"
         }
     )
 
@@ -56,34 +69,88 @@ class User(SQLModel, table=True):
         link_model=TeammateLink,
         sa_relationship_kwargs={
             "primaryjoin": "User.id==TeammateLink.user_id",
-            "secondaryjoin": "User.id==TeammateLink.teammate_id"
+            "secondaryjoin": "User.id==TeammateLink.teammate_id",
+            "lazy": "raise"
         }
     )
 
 # Database setup
 sqlite_database_name = "bootcampPortalDatabase.db"
-sqlite_url = f"sqlite:///{sqlite_database_name}"
-connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, connect_args=connect_args, echo=True)
-
-def create_db_and_tables():
-    SQLModel.metadata.create_all(engine)
-
-def reset_db_and_tables():
-    SQLModel.metadata.drop_all(engine)
-    create_db_and_tables()
-
-def get_session():
-    with Session(engine) as session:
+sqlite_url = f"sqlite+aiosqlite:///{sqlite_database_name}"
+# isolation_level=None stops the driver from opening transactions on its own; see do_begin.
+# timeout is how long a connection waits for the write lock, e.g. a seed queued behind the CSV load
+connect_args = {"check_same_thread": False, "isolation_level": None, "timeout": 30}
+# Set SQL_ECHO=1 to log every emitted statement while debugging
+engine = create_async_engine(sqlite_url, connect_args=connect_args, echo=os.getenv("SQL_ECHO") == "1")
+async_session = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+@event.listens_for(engine.sync_engine, "connect")
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers run alongside a writer and only needs an fsync at checkpoints
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+@event.listens_for(engine.sync_engine, "begin")
+def do_begin(conn):
+    if conn.get_execution_options().get("begin_immediate"):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conn.exec_driver_sql("BEGIN")
+
+# The seeds read before they write; IMMEDIATE takes the write lock up front so concurrent seeds queue
+# behind each other instead of both acting on the same read
+seed_engine = engine.execution_options(begin_immediate=True)
+
+def create_tables_and_indexes(sync_conn):
+    SQLModel.metadata.create_all(sync_conn)
+    # create_all only builds indexes for tables it creates; add any declared since an existing database was made
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+async def create_db_and_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(create_tables_and_indexes)
+
+async def reset_db_and_tables():
+    # Restore the default rows in place; no DROP/CREATE, and rows added since startup are kept.
+    # Safe to repeat or run concurrently: links follow the stored user ids and each seed checks under BEGIN IMMEDIATE
+    await asyncio.gather(seed_users(), seed_announcements())
+
+async def get_session():
+    async with async_session() as session:
         yield session
 
-SessionDep = Annotated[Session, Depends(get_session)]
-
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    print("Setting up the database...")
-    create_db_and_tables()
-
+SessionDep = Annotated[AsyncSession, Depends(get_session)]
+
+# Serialized GET /announcements response and its ETag, dropped whenever announcements change.
+# The version starts from the clock so ETags handed out before a restart never match after it
+_cache = {"version": time.time_ns(), "payload": None, "etag": None}
+_lock = asyncio.Lock()
+
+# Built once at import instead of on every request
+_STMT_ALL_ANNOUNCEMENTS = select(Announcement.id, Announcement.user_name, Announcement.tag, Announcement.description)
+
+def invalidate_announcements_cache():
+    _cache["version"] += 1
+    _cache["payload"] = None
+    _cache["etag"] = None
+
+def etag_matches(if_none_match, etag):
+    # Weak comparison (RFC 9110 13.1.2): any listed tag may match, W/ prefixes are ignored, and * matches anything
+    if if_none_match is None:
+        return False
+    opaque_tag = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque_tag:
+            return True
+    return False
+
+async def seed_users():
     # Aryan Info
     aryan_img_url = "https://media.licdn.com/dms/image/v2/D4E35AQH0AwVtQ2-fug/profile-framedphoto-shrink_400_400/profile-framedphoto-shrink_400_400/0/1721141409771?e=1733724000&v=beta&t=jmpNYpfjBzGmvT3Ys0Uh5GBXDizN4Ffgk06a8d97lAE"
     aryan_linkdin_url = "https://www.linkedin.com/in/aryanjain06/"
@@ -110,52 +177,66 @@ async def lifespan(app: FastAPI):
     kimber_linkdin_url = "https://www.linkedin.com/in/kimber-gonzalez-lopez/"
     kimber_github_url = "https://github.com/KiberVG"
 
-    aryan = User(name="Aryan", password="pass123", role="MENTEE", imgURL=aryan_img_url, linkdinURL=aryan_linkdin_url, githubURL=aryan_github_url)
-    aditi = User(name="Aditi", password="pass123", role="MENTEE", imgURL=aditi_img_url, linkdinURL=aditi_linkdin_url, githubURL=aditi_github_url)
-    gavin = User(name="Gavin", password="mentor123", role="MENTOR", imgURL=gavin_img_url, linkdinURL=gavin_linkdin_url, githubURL=gavin_github_url, websiteURL = gavin_website_url, resumeURL = gavin_resume_url)
-    # kimber = User(name="Kimber", password="teach123", role="TEACHER", imgURL=kimber_img_url, linkdinURL=kimber_linkdin_url, githubURL=kimber_github_url)
-    nitish = User(name="Nitish", password="mentor123", role="MENTOR", imgURL=nitish_img_url, linkdinURL=nitish_linkdin_url, githubURL=nitish_github_url)
-
-    aryan.teammates.append(aditi)
-    aditi.teammates.append(aryan)
-
-    # kimber.teammates.append(gavin)
-    # gavin.teammates.append(kimber)
+    user_rows = [
+        {"name": "Aryan", "password": "pass123", "role": "MENTEE", "imgURL": aryan_img_url, "linkdinURL": aryan_linkdin_url, "githubURL": aryan_github_url, "websiteURL": None, "resumeURL": None},
+        {"name": "Aditi", "password": "pass123", "role": "MENTEE", "imgURL": aditi_img_url, "linkdinURL": aditi_linkdin_url, "githubURL": aditi_github_url, "websiteURL": None, "resumeURL": None},
+        {"name": "Gavin", "password": "mentor123", "role": "MENTOR", "imgURL": gavin_img_url, "linkdinURL": gavin_linkdin_url, "githubURL": gavin_github_url, "websiteURL": gavin_website_url, "resumeURL": gavin_resume_url},
+        {"name": "Nitish", "password": "mentor123", "role": "MENTOR", "imgURL": nitish_img_url, "linkdinURL": nitish_linkdin_url, "githubURL": nitish_github_url, "websiteURL": None, "resumeURL": None},
+        # {"name": "Kimber", "password": "teach123", "role": "TEACHER", "imgURL": kimber_img_url, "linkdinURL": kimber_linkdin_url, "githubURL": kimber_github_url, "websiteURL": None, "resumeURL": None},
+    ]
+
+    # (mentor, mentee): Gavin and Nitish mentor Aryan and Aditi
+    mentor_pairs = [("Gavin", "Aryan"), ("Gavin", "Aditi"), ("Nitish", "Aryan"), ("Nitish", "Aditi")]
+
+    teammate_pairs = [
+        ("Aryan", "Aditi"),
+        ("Aditi", "Aryan"),
+        ("Gavin", "Nitish"),
+        ("Nitish", "Gavin"),
+        # ("Kimber", "Gavin"),
+        # ("Gavin", "Kimber"),
+    ]
+
+    # Core inserts skip ORM unit-of-work bookkeeping; users already present from a previous run are left alone
+    async with async_session(bind=seed_engine) as session, session.begin():
+        names = [row["name"] for row in user_rows]
+        existing = set((await session.exec(select(User.name).where(User.name.in_(names)))).all())
+        missing_rows = [row for row in user_rows if row["name"] not in existing]
+        if missing_rows:
+            await session.execute(insert(User.__table__), missing_rows)
+
+        # Links use the ids the database actually holds, which older databases numbered differently;
+        # if a name was seeded more than once, the lowest id wins
+        result = await session.exec(select(User.name, func.min(User.id)).where(User.name.in_(names)).group_by(User.name))
+        ids = dict(result.all())
+        mentor_links = [{"mentor_id": ids[mentor], "mentee_id": ids[mentee]} for mentor, mentee in mentor_pairs]
+        teammate_links = [{"user_id": ids[user], "teammate_id": ids[teammate]} for user, teammate in teammate_pairs]
+        await session.execute(sqlite_insert(MentorLink.__table__).on_conflict_do_nothing(), mentor_links)
+        await session.execute(sqlite_insert(TeammateLink.__table__).on_conflict_do_nothing(), teammate_links)
+
+async def seed_announcements():
+    # Parse one block at a time off the event loop; Arrow nulls already come out as None.
+    # Types are pinned because the streaming reader would otherwise infer them from the first block only
+    columns = ["user_name", "tag", "description"]
+    parse_options = pacsv.ParseOptions(newlines_in_values=True)
+    convert_options = pacsv.ConvertOptions(column_types={column: pa.string() for column in columns}, include_columns=columns)
+
+    async with async_session(bind=seed_engine) as session, session.begin():
+        # Populate Announcements from CSV unless a previous run already did
+        if await session.scalar(select(Announcement.id).limit(1)) is not None:
+            return
+
+        reader = await asyncio.to_thread(pacsv.open_csv, "data/announcements.csv", parse_options=parse_options, convert_options=convert_options)
+        while (batch := await asyncio.to_thread(next, reader, None)) is not None:
+            await session.execute(insert(Announcement.__table__), batch.to_pylist())
 
-    # aryan.teacher = kimber
-    # aditi.teacher = kimber
-
-    gavin.mentees.append(aryan)
-    gavin.mentees.append(aditi)
-    
-    nitish.mentees.append(aryan)
-    nitish.mentees.append(aditi)
-
-    gavin.teammates.append(nitish)
-    nitish.teammates.append(gavin)
-
-    # kimber.students.append(aryan)
-    # kimber.students.append(aditi)
-
-    with Session(engine) as session:
-        session.add_all([aryan,aditi,gavin, nitish])
-        session.commit()
-
-    # Populate Announcements from CSV
-    df_announcements = pd.read_csv("data/announcements.csv")
-    announcements = []
-    for _, row in df_announcements.iterrows():
-        announcement = Announcement(
-            user_name=row['user_name'],
-            tag=row['tag'],
-            description=row['description']
-        )
-
-        announcements.append(announcement)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    print("Setting up the database...")
+    await create_db_and_tables()
 
-    with Session(engine) as session:
-        session.add_all(announcements)
-        session.commit()
+    # Each seed holds the write lock for its own transaction, so whichever starts second waits for the first
+    await asyncio.gather(seed_users(), seed_announcements())
 
     yield
     print("App shutdown")
@@ -177,14 +258,16 @@ app.add_middleware(
 
 @app.get('/mentors')
 async def get_mentors(name: str, session: SessionDep):
-    user = session.exec(select(User).where(User.name == name)).first()
+    result = await session.exec(select(User).where(User.name == name).options(selectinload(User.mentors)))
+    user = result.first()
     if not user:
          raise HTTPException(status_code=404, detail="User not found")
     return user.mentors
 
 @app.get('/mentees')
 async def get_mentees(name: str, session: SessionDep):
-    user = session.exec(select(User).where(User.name == name)).first()
+    result = await session.exec(select(User).where(User.name == name).options(selectinload(User.mentees)))
+    user = result.first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user.mentees
@@ -192,7 +275,8 @@ async def get_mentees(name: str, session: SessionDep):
 
 @app.get('/teammates')
 async def get_teammates(name: str, session: SessionDep):
-    user = session.exec(select(User).where(User.name == name)).first()
+    result = await session.exec(select(User).where(User.name == name).options(selectinload(User.teammates)))
+    user = result.first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -200,7 +284,8 @@ async def get_teammates(name: str, session: SessionDep):
 
 @app.get('/links')
 async def get_links(name: str, session: SessionDep):
-    user = session.exec(select(User).where(User.name == name)).first()
+    result = await session.exec(select(User).where(User.name == name))
+    user = result.first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     output = {
@@ -213,24 +298,53 @@ async def get_links(name: str, session: SessionDep):
     return output
 
 @app.get('/announcements')
-async def get_announcements(session: SessionDep):
-    announcements = session.exec(select(Announcement)).all()
-    return announcements
+async def get_announcements(request: Request, session: SessionDep):
+    payload, etag = _cache["payload"], _cache["etag"]
+    if payload is None:
+        async with _lock:
+            payload, etag = _cache["payload"], _cache["etag"]
+            if payload is None:
+                version = _cache["version"]
+                # Plain column tuples skip ORM hydration and the identity map
+                result = await session.exec(_STMT_ALL_ANNOUNCEMENTS)
+                payload = orjson.dumps([dict(zip(("id", "user_name", "tag", "description"), row)) for row in result.all()])
+                etag = f'W/"{version}"'
+                # A write during the query bumps the version; don't cache its stale result
+                if version == _cache["version"]:
+                    _cache["payload"], _cache["etag"] = payload, etag
+
+    headers = {"etag": etag, "cache-control": "public, max-age=0, must-revalidate"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=payload, media_type="application/json", headers=headers)
+
+async def iter_announcement_rows():
+    # Own session: the request's session dependency is closed before streaming ends
+    async with async_session() as session:
+        result = await session.stream(_STMT_ALL_ANNOUNCEMENTS.execution_options(yield_per=1000))
+        async for row in result:
+            yield orjson.dumps(row._asdict()) + b"\n"
+
+@app.get('/announcements/stream')
+async def stream_announcements():
+    return StreamingResponse(iter_announcement_rows(), media_type="application/x-ndjson")
 
 @app.post('/announcements/new')
 async def post_announcement(announcement: Announcement, session: SessionDep):
     session.add(announcement)
 
     try:
-        session.commit()
+        await session.commit()
     except Exception as e:
-        session.rollback() 
+        await session.rollback() 
         raise HTTPException(status_code=500, detail="Database commit failed")  
-      
-    session.refresh(announcement)
+
+    invalidate_announcements_cache()
+    await session.refresh(announcement)
     return announcement
 
 @app.post('/reset-db')
 async def reset_database():
-    reset_db_and_tables()
+    await reset_db_and_tables()
+    invalidate_announcements_cache()
     return {"message": "Database has been reset"}
\ No newline at end of file